@@ -5,13 +5,16 @@ Student Response Report Generator
 This application generates Excel reports from a SQL Server database.
 IMPORTANT: All database operations are READ-ONLY.
 """
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 import os
 
+from config import settings
 from routes.reports import router as reports_router
 from database import test_connection
 
@@ -46,6 +49,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    GZip that leaves the Excel download alone: xlsx is already a zip
+    archive, so re-deflating it costs CPU per download for near-zero
+    size win and forces the response off FileResponse's sendfile path.
+    """
+
+    EXCLUDED_PATHS = ("/api/reports/student-responses",)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+# Compress responses over 1 KB (mainly the JSON metadata endpoints the
+# frontend polls - test dates, contest info, health)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1024, compresslevel=6)
+
 # Include routers
 app.include_router(reports_router)
 
@@ -54,6 +77,15 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 
+@app.on_event("startup")
+async def configure_worker_threads():
+    """
+    Bound the worker threads that run blocking pyodbc calls to the
+    connection pool size, so thread concurrency can't outrun the pool.
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.DB_POOL_SIZE
+
+
 @app.get("/", tags=["Root"])
 async def root():
     """Serve the frontend HTML page."""
@@ -25,6 +25,17 @@ class Settings(BaseSettings):
     # Query safety limits (set to 0 for unlimited)
     MAX_ROWS: int = int(os.getenv("MAX_ROWS", "0"))  # 0 = no limit
     QUERY_TIMEOUT: int = int(os.getenv("QUERY_TIMEOUT", "300"))  # 5 minutes for large queries
+
+    # Pivot student responses server-side (one row per student from SQL)
+    # instead of fetching one row per student-question and pivoting in pandas
+    PIVOT_IN_SQL: bool = os.getenv("PIVOT_IN_SQL", "true").lower() == "true"
+
+    # Worker processes for Excel serialization (CPU-bound XML/zip stage)
+    EXCEL_WORKERS: int = int(os.getenv("EXCEL_WORKERS", "2"))
+
+    # Connection pool settings
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))  # Max pooled connections
+    DB_POOL_MIN_IDLE: int = int(os.getenv("DB_POOL_MIN_IDLE", "2"))  # Connections pre-warmed on first use
     
     @property
     def connection_string(self) -> str:
@@ -1,45 +1,193 @@
 """
 Database connection module.
 Provides read-only connection to SQL Server database.
+
+Connections are pooled: instead of paying TCP + TDS login + session setup
+on every request, connections are created once, kept in a pool, and
+reused across requests.
 """
 import pyodbc
+import queue
+import threading
 from contextlib import contextmanager
 from typing import Generator
 from config import settings
 
+# Let the ODBC driver manager reuse connections under the hood as well
+pyodbc.pooling = True
+
+# Per-connection cap on cached statement cursors (the app only has a
+# handful of fixed query texts; this just bounds pathological growth)
+MAX_CACHED_STATEMENTS = 32
+
+
+class _PooledConnection:
+    """A pooled pyodbc connection plus its per-statement cursor cache"""
+
+    __slots__ = ('conn', 'cursors')
+
+    def __init__(self, conn: pyodbc.Connection):
+        self.conn = conn
+        # SQL text -> cursor dedicated to that statement. pyodbc keeps the
+        # prepared handle of the last SQL executed on a cursor, so routing
+        # each query text through its own cursor skips the server-side
+        # parse/prepare on every call after the first.
+        self.cursors = {}
+
+    def cursor_for(self, sql: str) -> pyodbc.Cursor:
+        cursor = self.cursors.get(sql)
+        if cursor is None:
+            if len(self.cursors) >= MAX_CACHED_STATEMENTS:
+                # Drop the oldest entry (insertion order) to stay bounded
+                oldest = self.cursors.pop(next(iter(self.cursors)))
+                try:
+                    oldest.close()
+                except pyodbc.Error:
+                    pass
+            cursor = self.conn.cursor()
+            self.cursors[sql] = cursor
+        return cursor
+
+    def close(self):
+        for cursor in self.cursors.values():
+            try:
+                cursor.close()
+            except pyodbc.Error:
+                pass
+        self.cursors.clear()
+        self.conn.close()
+
 
 class DatabaseConnection:
-    """Manages database connections with read-only intent"""
-    
+    """Manages a pool of database connections with read-only intent"""
+
     def __init__(self):
         self.connection_string = settings.connection_string
         self.timeout = settings.QUERY_TIMEOUT
-    
+        self.pool_size = settings.DB_POOL_SIZE
+        self.min_idle = settings.DB_POOL_MIN_IDLE
+        # Idle connections ready for reuse. Connections are created lazily
+        # (never at import time) so the app can start without a reachable DB.
+        self._pool: queue.Queue = queue.Queue(maxsize=self.pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._warmed = False
+
+    def _create_connection(self) -> '_PooledConnection':
+        """
+        Open a new connection and apply one-time session setup.
+
+        IMPORTANT: This connection is READ-ONLY.
+        Only SELECT queries should be executed.
+        """
+        conn = pyodbc.connect(
+            self.connection_string,
+            timeout=self.timeout,
+            autocommit=True  # Prevent transaction issues with read-only
+        )
+        # Set once per connection (it persists for the session lifetime)
+        conn.execute("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED")
+        return _PooledConnection(conn)
+
+    def _prewarm(self):
+        """Pre-create a few idle connections on first use"""
+        with self._lock:
+            if self._warmed:
+                return
+            self._warmed = True
+            to_create = min(self.min_idle, self.pool_size)
+        for _ in range(to_create):
+            try:
+                conn = self._create_connection()
+            except pyodbc.Error:
+                # DB not reachable yet - acquire will surface the real error
+                return
+            with self._lock:
+                self._created += 1
+            self._pool.put(conn)
+
+    def _is_healthy(self, entry: '_PooledConnection') -> bool:
+        """Cheap liveness check for a pooled connection"""
+        try:
+            entry.conn.execute("SELECT 1").fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _acquire(self) -> '_PooledConnection':
+        """Take a connection from the pool, creating one if under capacity"""
+        self._prewarm()
+        while True:
+            try:
+                entry = self._pool.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    under_capacity = self._created < self.pool_size
+                    if under_capacity:
+                        self._created += 1
+                if under_capacity:
+                    try:
+                        return self._create_connection()
+                    except pyodbc.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                # All connections checked out - block until one is returned
+                try:
+                    return self._pool.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise DatabaseError(
+                        f"Timed out waiting for a pooled connection after {self.timeout}s"
+                    )
+            # Got an idle connection - verify it survived being idle
+            if self._is_healthy(entry):
+                return entry
+            self._discard(entry)
+
+    def _release(self, entry: '_PooledConnection'):
+        """Return a connection to the pool for reuse"""
+        try:
+            self._pool.put_nowait(entry)
+        except queue.Full:
+            self._discard(entry)
+
+    def _discard(self, entry: '_PooledConnection'):
+        """Drop a dead or surplus connection"""
+        with self._lock:
+            self._created -= 1
+        try:
+            entry.close()
+        except pyodbc.Error:
+            pass
+
     @contextmanager
     def get_connection(self) -> Generator[pyodbc.Connection, None, None]:
         """
         Context manager for database connections.
-        Ensures connections are properly closed after use.
-        
+        Acquires a pooled connection and returns it to the pool after use.
+
         IMPORTANT: This connection is READ-ONLY.
         Only SELECT queries should be executed.
         """
-        conn = None
         try:
-            conn = pyodbc.connect(
-                self.connection_string,
-                timeout=self.timeout,
-                autocommit=True  # Prevent transaction issues with read-only
-            )
-            # Set connection to read-only mode
-            conn.execute("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED")
-            yield conn
+            entry = self._acquire()
         except pyodbc.Error as e:
             raise DatabaseError(f"Database connection error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
-    
+        try:
+            yield entry.conn
+        except pyodbc.Error as e:
+            # Connection state is suspect after a driver error - don't reuse it
+            self._discard(entry)
+            raise DatabaseError(f"Database connection error: {str(e)}")
+        except BaseException:
+            # Non-driver failure in the caller (MemoryError, a bug in row
+            # handling, Ctrl-C) - discard rather than leak the checkout,
+            # so the pool slot is reclaimed
+            self._discard(entry)
+            raise
+        else:
+            self._release(entry)
+
     @contextmanager
     def get_cursor(self) -> Generator[pyodbc.Cursor, None, None]:
         """
@@ -53,6 +201,36 @@ class DatabaseConnection:
             finally:
                 cursor.close()
 
+    @contextmanager
+    def get_statement(self, sql: str) -> Generator[pyodbc.Cursor, None, None]:
+        """
+        Context manager yielding a cursor dedicated to one SQL text.
+
+        Executing the same text through the same cursor lets pyodbc reuse
+        the prepared statement handle, skipping the per-call parse/bind
+        on SQL Server. Use for the fixed, high-frequency query texts;
+        dynamically built SQL should go through get_cursor instead so it
+        doesn't churn the per-connection cursor cache.
+        """
+        try:
+            entry = self._acquire()
+        except pyodbc.Error as e:
+            raise DatabaseError(f"Database connection error: {str(e)}")
+        try:
+            yield entry.cursor_for(sql)
+        except pyodbc.Error as e:
+            # Connection state is suspect after a driver error - don't reuse it
+            self._discard(entry)
+            raise DatabaseError(f"Database connection error: {str(e)}")
+        except BaseException:
+            # Non-driver failure in the caller (MemoryError, a bug in row
+            # handling, Ctrl-C) - discard rather than leak the checkout,
+            # so the pool slot is reclaimed
+            self._discard(entry)
+            raise
+        else:
+            self._release(entry)
+
 
 class DatabaseError(Exception):
     """Custom exception for database errors"""
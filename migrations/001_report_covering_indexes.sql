@@ -0,0 +1,18 @@
+-- Recommended indexes for the student response report queries.
+--
+-- This application is READ-ONLY and never runs DDL; this script is
+-- documentation for the DBA to apply during a maintenance window.
+--
+-- 1. CCTTestStudents is probed by (ContestCreationID, UserId) to resolve
+--    the actual test date. A composite index turns that into a seek.
+CREATE NONCLUSTERED INDEX IX_CCTTestStudents_Contest_User
+    ON CCTTestStudents (ContestCreationId, UserId)
+    INCLUDE (TestStartDateTime);
+
+-- 2. CCTTestResults is the large fact table. The report filters on
+--    ContestCreationID and reads (UserID, QuestionID, UserAnswer, Credits);
+--    covering those columns avoids key lookups and lets the question-level
+--    query seek instead of scan.
+CREATE NONCLUSTERED INDEX IX_CCTTestResults_Contest_User_Question
+    ON CCTTestResults (ContestCreationID, UserID, QuestionID)
+    INCLUDE (UserAnswer, Credits);
@@ -1,13 +1,21 @@
 """
 API routes for report generation.
+
+The query service is synchronous pyodbc, so every DB call here goes
+through anyio.to_thread.run_sync - the event loop keeps serving other
+requests while a report is being fetched.
 """
+import anyio
+import os
 from fastapi import APIRouter, Query, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse
+from functools import partial
+from starlette.background import BackgroundTask
 from typing import Optional, List
 from datetime import date, datetime
 
 from services.query_service import query_service
-from services.excel_service import excel_service
+from services.excel_service import excel_service, generate_excel_async
 from database import DatabaseError
 
 
@@ -21,13 +29,14 @@ async def get_test_dates(contest_id: int):
     Use this to populate a date picker before downloading the report.
     """
     try:
-        if not query_service.validate_contest_exists(contest_id):
+        exists, _ = await anyio.to_thread.run_sync(query_service.get_report_prelude, contest_id)
+        if not exists:
             raise HTTPException(
                 status_code=404,
                 detail=f"Contest with ID {contest_id} not found"
             )
-        
-        dates = query_service.get_available_test_dates(contest_id)
+
+        dates = await anyio.to_thread.run_sync(query_service.get_available_test_dates, contest_id)
         return {
             "contest_id": contest_id,
             "test_dates": dates,
@@ -58,47 +67,50 @@ async def get_student_responses_report(
     Each student appears as ONE row with all their question responses as columns.
     """
     try:
-        # Validate contest exists
-        if not query_service.validate_contest_exists(contest_id):
+        # Validate contest exists and get report-header info in one query
+        exists, contest_info = await anyio.to_thread.run_sync(
+            query_service.get_report_prelude, contest_id
+        )
+        if not exists:
             raise HTTPException(
                 status_code=404,
                 detail=f"Contest with ID {contest_id} not found"
             )
-        
-        # Get contest info for the report header
-        contest_info = query_service.get_contest_info(contest_id)
-        
+
         # Fetch the student response data for the specific test date
-        raw_df = query_service.get_student_responses(
+        raw_df = await anyio.to_thread.run_sync(partial(
+            query_service.get_student_responses,
             contest_id=contest_id,
             test_date=test_date,
             grade=grade,
             school_id=school_id
-        )
+        ))
         
         # Pivot the data to one row per student
         pivoted_df = excel_service.pivot_student_data(raw_df)
         
-        # Generate the Excel file
-        excel_buffer = excel_service.generate_excel(
+        # Generate the Excel file in a worker (returns a temp-file path)
+        excel_path = await generate_excel_async(
             df=pivoted_df,
             contest_id=contest_id,
             contest_info=contest_info
         )
-        
+
         # Generate filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"student_responses_contest_{contest_id}_{timestamp}.xlsx"
-        
-        # Return as downloadable file
-        return StreamingResponse(
-            excel_buffer,
+
+        # Return as downloadable file; FileResponse sends straight from
+        # the page cache (sendfile) and the temp file is removed after
+        return FileResponse(
+            excel_path,
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
+            filename=filename,
+            background=BackgroundTask(os.unlink, excel_path)
         )
         
+    except HTTPException:
+        raise
     except DatabaseError as e:
         raise HTTPException(
             status_code=500,
@@ -118,14 +130,14 @@ async def get_contest_info(contest_id: int):
     Useful for validating contest IDs and getting metadata.
     """
     try:
-        if not query_service.validate_contest_exists(contest_id):
+        exists, info = await anyio.to_thread.run_sync(query_service.get_report_prelude, contest_id)
+        if not exists:
             raise HTTPException(
                 status_code=404,
                 detail=f"Contest with ID {contest_id} not found"
             )
-        
-        info = query_service.get_contest_info(contest_id)
-        question_count = query_service.get_question_count(contest_id)
+
+        question_count = await anyio.to_thread.run_sync(query_service.get_question_count, contest_id)
         
         return {
             "contest_id": contest_id,
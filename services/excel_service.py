@@ -2,16 +2,22 @@
 Excel Generation Service.
 
 Generates Excel reports with pivoted student response data.
-Uses pandas and openpyxl for Excel creation.
+Uses pandas and xlsxwriter for Excel creation.
+
+The workbook is written in xlsxwriter's constant_memory mode to a temp
+file, which the route hands to FileResponse - so peak memory stays
+bounded and transmission goes through the kernel sendfile path.
 """
+import asyncio
+import threading
+import numpy as np
 import pandas as pd
-from io import BytesIO
+import xlsxwriter
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import NamedTemporaryFile
 from typing import List, Optional
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.utils import get_column_letter
+from config import settings
 
 
 class ExcelService:
@@ -44,38 +50,62 @@ class ExcelService:
     ]
     
     def __init__(self):
-        # Styling
-        self.header_font = Font(bold=True, color="FFFFFF")
-        self.header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        self.header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        self.border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        # Styling (xlsxwriter format specs, instantiated per workbook)
+        self.header_format_spec = {
+            'bold': True,
+            'bg_color': '#4472C4',
+            'font_color': '#FFFFFF',
+            'align': 'center',
+            'valign': 'vcenter',
+            'text_wrap': True
+        }
+        self.title_format_spec = {'bold': True, 'font_size': 14}
     
+    def _format_test_date(self, series: pd.Series) -> pd.Series:
+        """
+        Format datetimes as YYYY-MM-DD with numpy's vectorized ISO
+        formatter at day resolution - one C-level pass instead of the
+        per-element libc strftime that .dt.strftime dispatches.
+        """
+        days = pd.to_datetime(series).to_numpy().astype('datetime64[D]')
+        return pd.Series(np.datetime_as_string(days, unit='D'), index=series.index)
+
     def pivot_student_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Transform the raw query data (one row per student-question)
         into pivoted format (one row per student, question details as columns).
-        
-        Uses pandas pivot_table for fast O(n log n) performance.
+
+        Since each (StudentId, QNum) pair is unique, the pivot is really an
+        index assignment into dense 2D arrays - done here as a single
+        vectorized NumPy scatter per column instead of pivot_table's
+        groupby/MultiIndex machinery.
         """
         if df.empty:
             return pd.DataFrame()
-        
-        # Get unique students with their base info
-        student_cols = ['StudentId', 'FirstName', 'LastName', 'Gender', 'Grade', 
-                       'SchoolId', 'SchoolName', 'Region', 'TestDate']
-        
-        # Get the student base data (drop duplicates)
-        students_df = df[student_cols].drop_duplicates(subset=['StudentId'])
-        
+
+        if 'QuestionID' not in df.columns:
+            # Already pivoted server-side (one row per student with
+            # Q1_..., Q2_... columns) - only formatting and fills remain
+            result_df = df.copy()
+            if 'TestDate' in result_df.columns:
+                result_df['TestDate'] = self._format_test_date(result_df['TestDate'])
+            # Strip the <p></p> markup around correct answers (vectorized,
+            # instead of per-row REPLACE calls in the SQL)
+            for col in result_df.columns:
+                if col.endswith('_CorrectAnswer'):
+                    result_df[col] = result_df[col].str.replace(r'</?p>', '', regex=True)
+            n_questions = sum(1 for col in result_df.columns if col.endswith('_QuestionId'))
+            return self._finalize_columns(result_df, n_questions)
+
+        # Get unique students with their base info - one groupby pass
+        # (hash build) instead of drop_duplicates + a later merge probe
+        student_cols = ['FirstName', 'LastName', 'Gender', 'Grade',
+                        'SchoolId', 'SchoolName', 'Region', 'TestDate']
+        students_df = df.groupby('StudentId', sort=False, as_index=False)[student_cols].first()
+
         # Format TestDate as readable string (YYYY-MM-DD)
         if 'TestDate' in students_df.columns:
-            students_df = students_df.copy()
-            students_df['TestDate'] = pd.to_datetime(students_df['TestDate']).dt.strftime('%Y-%m-%d')
+            students_df['TestDate'] = self._format_test_date(students_df['TestDate'])
         
         # Create a question number mapping (sorted by QuestionID)
         all_question_ids = sorted(df['QuestionID'].unique())
@@ -84,142 +114,227 @@ class ExcelService:
         # Add question number to dataframe
         df = df.copy()
         df['QNum'] = df['QuestionID'].map(q_id_to_num)
+
+        # Strip the <p></p> markup around correct answers (vectorized,
+        # instead of per-row REPLACE calls in the SQL)
+        df['CorrectAnswer'] = df['CorrectAnswer'].str.replace(r'</?p>', '', regex=True)
         
-        # Pivot each column we need using pivot_table (FAST!)
+        # Columns to pivot and their output names
         pivot_cols = {
             'QuestionID': 'QuestionId',
-            'Subject': 'Subject', 
+            'Subject': 'Subject',
             'Level': 'Level',
             'QuestionType': 'Type',
             'StudentAnswer': 'StudentAnswer',
             'CorrectAnswer': 'CorrectAnswer',
             'Score': 'Score'
         }
-        
-        # Create pivot for all columns at once
-        pivoted = df.pivot_table(
-            index='StudentId',
-            columns='QNum',
-            values=list(pivot_cols.keys()),
-            aggfunc='first'
+
+        # Map each row to (student row, question column) positions
+        student_codes, student_ids = pd.factorize(df['StudentId'])
+        qnum_codes = df['QNum'].to_numpy() - 1
+        shape = (len(student_ids), len(all_question_ids))
+
+        # One dense output array per pivoted column; a single vectorized
+        # scatter fills each (no hashing beyond the factorize above).
+        # Arrays start out holding the report's blank-cell defaults, so
+        # unanswered questions need no separate fillna pass afterwards.
+        scattered = {}
+        for source_col in pivot_cols:
+            if source_col == 'Score':
+                out = np.full(shape, 0, dtype='float32')
+            elif source_col == 'StudentAnswer':
+                out = np.full(shape, 'Not Answered', dtype=object)
+            else:
+                out = np.full(shape, 'N/A', dtype=object)
+            out[student_codes, qnum_codes] = df[source_col].to_numpy()
+            scattered[source_col] = out
+
+        # Assemble the wide frame: Q1_QuestionId, Q1_Subject, ..., Qn_Score
+        data = {}
+        for q_idx in range(len(all_question_ids)):
+            for source_col, out_name in pivot_cols.items():
+                data[f"Q{q_idx + 1}_{out_name}"] = scattered[source_col][:, q_idx]
+        pivoted = pd.DataFrame(data, index=student_ids)
+
+        # Align by position rather than a hash join: the factorize order
+        # matches the groupby(sort=False) order, so this reindex is an
+        # identity pass and the concat is a straight column append
+        pivoted = pivoted.reindex(students_df['StudentId'].to_numpy())
+        result_df = pd.concat(
+            [students_df.reset_index(drop=True), pivoted.reset_index(drop=True)],
+            axis=1
         )
-        
-        # Flatten column names: ('StudentAnswer', 1) -> 'Q1_StudentAnswer'
-        new_columns = []
-        for col in pivoted.columns:
-            value_name, q_num = col
-            new_col_name = f"Q{q_num}_{pivot_cols[value_name]}"
-            new_columns.append(new_col_name)
-        pivoted.columns = new_columns
-        
-        # Reset index to make StudentId a column
-        pivoted = pivoted.reset_index()
-        
-        # Merge with student info
-        result_df = students_df.merge(pivoted, on='StudentId', how='left')
-        
-        # Reorder columns: student info first, then question columns in order
+
+        return self._finalize_columns(result_df, len(all_question_ids))
+
+    def _finalize_columns(self, result_df: pd.DataFrame, n_questions: int) -> pd.DataFrame:
+        """
+        Order columns (student info first, then question blocks) and fill
+        blanks for questions a student didn't answer.
+        """
+        # Build the fill groups alongside the column order, so there is no
+        # separate per-column endswith pass afterwards
         final_columns = self.STUDENT_COLUMNS.copy()
-        for idx in range(1, len(all_question_ids) + 1):
+        answer_cols: List[str] = []
+        score_cols: List[str] = []
+        na_cols: List[str] = []
+        for idx in range(1, n_questions + 1):
             prefix = f"Q{idx}_"
             for col in self.QUESTION_COLUMNS:
                 col_name = f"{prefix}{col}"
                 if col_name in result_df.columns:
                     final_columns.append(col_name)
-        
+                    if col == 'StudentAnswer':
+                        answer_cols.append(col_name)
+                    elif col == 'Score':
+                        score_cols.append(col_name)
+                    else:
+                        na_cols.append(col_name)
+
         # Only keep columns that exist
         final_columns = [c for c in final_columns if c in result_df.columns]
         result_df = result_df[final_columns]
-        
-        # Fill blanks for questions student didn't answer
-        for col in result_df.columns:
-            if col.endswith('_StudentAnswer'):
-                result_df[col] = result_df[col].fillna('Not Answered')
-            elif col.endswith('_Score'):
-                result_df[col] = result_df[col].fillna(0)
-            elif col.endswith('_QuestionId') or col.endswith('_Subject') or col.endswith('_Level') or col.endswith('_Type') or col.endswith('_CorrectAnswer'):
-                result_df[col] = result_df[col].fillna('N/A')
-        
+
+        # Fill blanks for questions student didn't answer: one
+        # frame-level fill per group instead of a Python loop per column
+        if answer_cols:
+            result_df[answer_cols] = result_df[answer_cols].fillna('Not Answered')
+        if score_cols:
+            result_df[score_cols] = result_df[score_cols].fillna(0)
+        if na_cols:
+            result_df[na_cols] = result_df[na_cols].fillna('N/A')
+
         return result_df
     
-    def generate_excel(
-        self, 
+    def generate_excel_file(
+        self,
         df: pd.DataFrame,
         contest_id: int,
         contest_info: Optional[dict] = None
-    ) -> BytesIO:
+    ) -> str:
         """
-        Generate an Excel file from the pivoted DataFrame.
-        Uses pandas to_excel for fast writing.
-        Returns a BytesIO buffer containing the Excel file.
+        Write the Excel report to a temp file and return its path.
+        Uses xlsxwriter in constant_memory mode so rows are serialized to
+        XML as they are written instead of being held in a worksheet tree.
         """
-        buffer = BytesIO()
-        
+        tmp = NamedTemporaryFile(suffix='.xlsx', delete=False)
+        tmp.close()
+        wb = xlsxwriter.Workbook(tmp.name, {
+            'constant_memory': True,
+            'strings_to_urls': False,
+            'nan_inf_to_errors': True,
+            'use_zip64': True
+        })
+
         if df.empty:
             # Handle empty data case
-            wb = Workbook()
-            ws = wb.active
-            ws['A1'] = f"Contest ID: {contest_id}"
-            ws['A2'] = "No data found for the specified filters."
-            wb.save(buffer)
-            buffer.seek(0)
-            return buffer
-        
-        # Use pandas ExcelWriter for fast writing
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            # Write main data starting at row 4 (leave room for header)
-            df.to_excel(writer, sheet_name='Student Responses', index=False, startrow=3)
-            
-            # Get the workbook and worksheet
-            wb = writer.book
-            ws = writer.sheets['Student Responses']
-            
-            # Add metadata header
-            ws['A1'] = f"Contest ID: {contest_id}"
-            ws['A1'].font = Font(bold=True, size=14)
-            ws['A2'] = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            ws['A3'] = f"Students: {len(df)} | Questions: {(len(df.columns) - len(self.STUDENT_COLUMNS)) // 7}"
-            
-            # Style the header row (row 4)
-            for col_idx in range(1, len(df.columns) + 1):
-                cell = ws.cell(row=4, column=col_idx)
-                cell.font = self.header_font
-                cell.fill = self.header_fill
-                cell.alignment = self.header_alignment
-            
-            # Freeze panes (header + student columns)
-            ws.freeze_panes = ws.cell(row=5, column=len(self.STUDENT_COLUMNS) + 1)
-            
-            # Set reasonable column widths
-            for i, col in enumerate(df.columns, 1):
-                col_letter = get_column_letter(i)
-                if col == 'TestDate':
-                    ws.column_dimensions[col_letter].width = 12
-                elif col == 'SchoolName':
-                    ws.column_dimensions[col_letter].width = 25
-                elif col in self.STUDENT_COLUMNS:
-                    ws.column_dimensions[col_letter].width = 12
-                else:
-                    ws.column_dimensions[col_letter].width = 10
-            
-            # Add summary sheet
-            summary_data = {
-                'Metric': ['Contest ID', 'Total Students', 'Total Schools', 
-                          'Total Questions', 'Generated At'],
-                'Value': [
-                    contest_id,
-                    len(df),
-                    df['SchoolId'].nunique() if 'SchoolId' in df.columns else 0,
-                    (len(df.columns) - len(self.STUDENT_COLUMNS)) // 7,
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-        
-        buffer.seek(0)
-        return buffer
+            ws = wb.add_worksheet('Student Responses')
+            ws.write(0, 0, f"Contest ID: {contest_id}")
+            ws.write(1, 0, "No data found for the specified filters.")
+            wb.close()
+            return tmp.name
+
+        # Nullable columns (e.g. Grade as Int16) surface missing values as
+        # pd.NA, which xlsxwriter can't write; map NA/NaN to None so they
+        # come out as blank cells. Only columns that actually hold missing
+        # values pay the object conversion.
+        na_cols = df.columns[df.isna().any()]
+        if len(na_cols):
+            df = df.copy()
+            df[na_cols] = df[na_cols].astype(object).where(df[na_cols].notna(), None)
+
+        title_format = wb.add_format(self.title_format_spec)
+        header_format = wb.add_format(self.header_format_spec)
+
+        ws = wb.add_worksheet('Student Responses')
+
+        # Column widths: one default for the question block, overrides for
+        # the student block (per-column overrides win over range defaults)
+        n_student_cols = len(self.STUDENT_COLUMNS)
+        ws.set_column(0, len(df.columns) - 1, 10)
+        ws.set_column(0, n_student_cols - 1, 12)
+        if 'SchoolName' in df.columns:
+            school_idx = df.columns.get_loc('SchoolName')
+            ws.set_column(school_idx, school_idx, 25)
+
+        # Freeze panes (header + student columns)
+        ws.freeze_panes(4, n_student_cols)
+
+        # constant_memory flushes rows as they are written, so everything
+        # below stays in strict row order: metadata, header, then data
+        ws.write(0, 0, f"Contest ID: {contest_id}", title_format)
+        ws.write(1, 0, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        ws.write(2, 0, f"Students: {len(df)} | Questions: {(len(df.columns) - len(self.STUDENT_COLUMNS)) // 7}")
+
+        # Styled header row (row 4) - the format applies per cell without
+        # touching the data rows
+        ws.write_row(3, 0, df.columns, header_format)
+
+        # Data rows, streamed straight into the XML serializer
+        for row_idx, row in enumerate(df.itertuples(index=False, name=None), start=4):
+            ws.write_row(row_idx, 0, row)
+
+        # Add summary sheet
+        summary_ws = wb.add_worksheet('Summary')
+        summary_rows = [
+            ('Metric', 'Value'),
+            ('Contest ID', contest_id),
+            ('Total Students', len(df)),
+            ('Total Schools', df['SchoolId'].nunique() if 'SchoolId' in df.columns else 0),
+            ('Total Questions', (len(df.columns) - len(self.STUDENT_COLUMNS)) // 7),
+            ('Generated At', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        ]
+        for row_idx, row in enumerate(summary_rows):
+            summary_ws.write_row(row_idx, 0, row)
+
+        wb.close()
+        return tmp.name
 
 
 # Global service instance
 excel_service = ExcelService()
+
+
+# Worker pool for Excel serialization. The XML/zip stage is pure CPU, so
+# running it in worker processes lets concurrent report downloads use
+# multiple cores instead of queueing behind the GIL.
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_failed = False
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Lazily create the worker pool; None if processes are unavailable"""
+    global _process_pool, _process_pool_failed
+    if _process_pool is None and not _process_pool_failed:
+        with _process_pool_lock:
+            if _process_pool is None and not _process_pool_failed:
+                try:
+                    _process_pool = ProcessPoolExecutor(max_workers=settings.EXCEL_WORKERS)
+                except OSError:
+                    # Restricted runtimes (e.g. serverless) may not allow
+                    # spawning processes - fall back to in-process threads
+                    _process_pool_failed = True
+    return _process_pool
+
+
+def _generate_excel_file(df: pd.DataFrame, contest_id: int, contest_info: Optional[dict]) -> str:
+    """Module-level entry point so the work ships cleanly to a worker process"""
+    return excel_service.generate_excel_file(df, contest_id, contest_info)
+
+
+async def generate_excel_async(
+    df: pd.DataFrame,
+    contest_id: int,
+    contest_info: Optional[dict] = None
+) -> str:
+    """
+    Serialize the report off the event loop (in a worker process when
+    available, otherwise a thread) and return the temp-file path.
+    The caller is responsible for unlinking the file after sending it.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_process_pool(), _generate_excel_file, df, contest_id, contest_info
+    )
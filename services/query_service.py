@@ -5,12 +5,63 @@ IMPORTANT: This module ONLY executes SELECT queries.
 NEVER modify data - this is a production database!
 """
 import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import date
 from database import db, DatabaseError
 from config import settings
 
 
+# TTLs for the in-process metadata cache (seconds).
+# Contest metadata changes rarely, and existence effectively never does
+# (contests are created, not destroyed), so it gets a longer TTL.
+METADATA_CACHE_TTL = 300
+VALIDATION_CACHE_TTL = 3600
+
+# Sentinel so cached falsy values ({}, False, []) are distinguishable from a miss
+_MISSING = object()
+
+
+class _TTLCache:
+    """
+    Small thread-safe in-process cache with per-entry expiry.
+    Avoids re-running identical metadata SELECTs on every page load.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return _MISSING
+            return value
+
+    def set(self, key: Any, value: Any, ttl: float):
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                # Drop the oldest entry (insertion order) to stay bounded
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared cache for contest metadata, keyed by (query name, contest_id)
+_metadata_cache = _TTLCache(maxsize=1024)
+
+
 class QueryService:
     """
     Service for executing read-only SQL queries.
@@ -19,7 +70,37 @@ class QueryService:
     
     def __init__(self):
         self.max_rows = settings.MAX_ROWS
-    
+
+    def _fetch_dataframe(self, query: str, params: List[Any]) -> pd.DataFrame:
+        """
+        Execute a SELECT and return the result as a DataFrame.
+
+        Fetches rows through the cursor directly and builds the frame with
+        explicit column names from the cursor description - faster than
+        pd.read_sql_query, which goes through its own driver introspection.
+        """
+        with db.get_cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        return pd.DataFrame.from_records((tuple(row) for row in rows), columns=columns)
+
+    def _coerce_report_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Coerce driver-inferred object columns to native dtypes up front,
+        so downstream drop_duplicates/merge/pivot work hashes int lanes
+        instead of Python objects, and TestDate needs only one datetime
+        parse for the whole pipeline. Grade is nullable, hence Int16.
+        """
+        for col, dtype in (('SchoolId', 'int32'), ('QuestionID', 'int32'), ('Score', 'float32')):
+            if col in df.columns:
+                df[col] = df[col].astype(dtype)
+        if 'Grade' in df.columns:
+            df['Grade'] = df['Grade'].astype('Int16')
+        if 'TestDate' in df.columns:
+            df['TestDate'] = pd.to_datetime(df['TestDate'])
+        return df
+
     def get_student_responses(
         self,
         contest_id: int,
@@ -29,120 +110,273 @@ class QueryService:
     ) -> pd.DataFrame:
         """
         Fetch student responses for a contest on a specific test date.
-        Returns a DataFrame with one row per student-question combination.
-        
-        This query will be pivoted later to have one row per student.
+
+        By default the pivot happens server-side (conditional aggregation),
+        returning one row per student with Q1_..., Q2_... columns - far
+        fewer rows over the wire than the one-row-per-student-question
+        format. Falls back to the long format (pivoted later in pandas)
+        when disabled or when the contest has too many questions to
+        parameterize.
+        """
+        if settings.PIVOT_IN_SQL:
+            question_ids = self.get_question_ids(contest_id)
+            # 7 CASE parameters per question plus filters must stay under
+            # SQL Server's 2100-parameter limit
+            if question_ids and 7 * len(question_ids) < 2000:
+                return self._fetch_responses_pivoted(
+                    question_ids, contest_id, test_date, grade, school_id
+                )
+        return self._fetch_responses_long(contest_id, test_date, grade, school_id)
+
+    def _fetch_responses_pivoted(
+        self,
+        question_ids: List[int],
+        contest_id: int,
+        test_date: date,
+        grade: Optional[int] = None,
+        school_id: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Fetch responses already pivoted to one row per student, using
+        MAX(CASE WHEN QuestionID = ? ...) conditional aggregation so the
+        reduction happens on the database instead of in pandas.
         """
-        # Build the base query with all necessary joins
-        # TOP clause is optional - 0 means no limit
         top_clause = f"TOP {self.max_rows}" if self.max_rows > 0 else ""
+
+        # One block of 7 pivoted columns per question, in question order
+        case_columns = []
+        case_params: List[Any] = []
+        for q_num, question_id in enumerate(question_ids, 1):
+            case_columns.append(f"""
+            MAX(CASE WHEN tr.QuestionID = ? THEN tr.QuestionID END) AS Q{q_num}_QuestionId,
+            MAX(CASE WHEN tr.QuestionID = ? THEN COALESCE(subj.SubjectName, 'N/A') END) AS Q{q_num}_Subject,
+            MAX(CASE WHEN tr.QuestionID = ? THEN COALESCE(lvl.LovName, 'N/A') END) AS Q{q_num}_Level,
+            MAX(CASE WHEN tr.QuestionID = ? THEN COALESCE(qb.QuestionType, 'N/A') END) AS Q{q_num}_Type,
+            MAX(CASE WHEN tr.QuestionID = ? THEN
+                CASE WHEN tr.UserAnswer IS NULL OR tr.UserAnswer = '' THEN 'Not Answered' ELSE tr.UserAnswer END
+            END) AS Q{q_num}_StudentAnswer,
+            MAX(CASE WHEN tr.QuestionID = ? THEN COALESCE(qb.Answer, 'N/A') END) AS Q{q_num}_CorrectAnswer,
+            MAX(CASE WHEN tr.QuestionID = ? THEN COALESCE(tr.Credits, 0) END) AS Q{q_num}_Score""")
+            case_params.extend([question_id] * 7)
+
         query = f"""
         SELECT {top_clause}
-            -- Test Date
             COALESCE(ts.TestStartDateTime, cc.ExamStartDateTime) AS TestDate,
-            
-            -- School Info
             s.Id AS SchoolId,
             s.SchoolName,
-            
-            -- Student Info
             u.LoginId AS StudentId,
             u.FirstName,
             u.LastName,
             u.Gender,
             u.Grade,
-            
-            -- Region (from School.RegionID -> Region table)
             COALESCE(reg.RegionName, 'N/A') AS Region,
-            
-            -- Question Info
-            tr.QuestionID,
-            COALESCE(qb.QuestionType, 'N/A') AS QuestionType,
-            COALESCE(subj.SubjectName, 'N/A') AS Subject,
-            COALESCE(lvl.LovName, 'N/A') AS Level,
-            
-            -- Answers and Score (strip HTML from CorrectAnswer, mark unanswered)
-            CASE 
-                WHEN tr.UserAnswer IS NULL OR tr.UserAnswer = '' THEN 'Not Answered'
-                ELSE tr.UserAnswer 
-            END AS StudentAnswer,
-            -- Strip <p> and </p> tags from Answer
-            REPLACE(REPLACE(COALESCE(qb.Answer, 'N/A'), '<p>', ''), '</p>', '') AS CorrectAnswer,
-            COALESCE(tr.Credits, 0) AS Score
-            
+            {','.join(case_columns)}
         FROM CCTTestResults tr WITH (NOLOCK)
-        
-        -- Join to Users for student info
         INNER JOIN Users u WITH (NOLOCK)
             ON tr.UserID = u.UserId
-            
-        -- Join to School
         INNER JOIN School s WITH (NOLOCK)
             ON u.SchoolId = s.Id
-            
-        -- Join to ContestCreation for test metadata
         INNER JOIN ContestCreation cc WITH (NOLOCK)
             ON tr.ContestCreationID = cc.ContestCreationID
-            
-        -- Left join to test attendance for actual test date
         LEFT JOIN CCTTestStudents ts WITH (NOLOCK)
-            ON tr.UserID = ts.UserId 
+            ON tr.UserID = ts.UserId
             AND tr.ContestCreationID = ts.ContestCreationId
-            
-        -- Join to QBankMaster for question details
         LEFT JOIN QBankMaster qb WITH (NOLOCK)
             ON tr.QuestionID = qb.QuestionID
-            
-        -- Join to Subject for subject name
         LEFT JOIN Subject subj WITH (NOLOCK)
             ON qb.SubjectId = subj.SubjectId
-            
-        -- Join to Lov for question difficulty level
         LEFT JOIN Lov lvl WITH (NOLOCK)
             ON qb.Level = lvl.LovId
-            
-        -- Join for Region from School.RegionID
         LEFT JOIN Region reg WITH (NOLOCK)
             ON s.RegionID = reg.RegionID
-            
         WHERE tr.ContestCreationID = ?
         AND CAST(COALESCE(ts.TestStartDateTime, cc.ExamStartDateTime) AS DATE) = ?
         """
-        
-        # Build parameter list
-        params: List[Any] = [contest_id, test_date.isoformat()]
-        
-        # Add optional filters
+
+        params: List[Any] = case_params + [contest_id, test_date.isoformat()]
+
         if grade is not None:
             query += " AND u.Grade = ?"
             params.append(grade)
-            
+
         if school_id is not None:
             query += " AND s.Id = ?"
             params.append(school_id)
-        
-        # Order by student and question
+
         query += """
-        ORDER BY 
+        GROUP BY
+            COALESCE(ts.TestStartDateTime, cc.ExamStartDateTime),
+            s.Id,
             s.SchoolName,
+            u.LoginId,
+            u.FirstName,
             u.LastName,
+            u.Gender,
+            u.Grade,
+            COALESCE(reg.RegionName, 'N/A')
+        ORDER BY
+            s.SchoolName,
+            u.LastName,
+            u.FirstName
+        """
+
+        try:
+            df = self._fetch_dataframe(query, params)
+        except Exception as e:
+            raise DatabaseError(f"Error fetching student responses: {str(e)}")
+        return self._coerce_report_dtypes(df)
+
+    def _fetch_responses_long(
+        self,
+        contest_id: int,
+        test_date: date,
+        grade: Optional[int] = None,
+        school_id: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Fetch responses as one row per student-question combination.
+
+        Runs as two queries merged client-side: a student-level SELECT
+        that returns each student's fixed columns exactly once, and a
+        narrow question-level SELECT. The old single query repeated the
+        wide student columns (SchoolName, names, region) on every one of
+        the student x question rows, so splitting cuts the repeated
+        bytes on the wire by roughly the question count. Both queries
+        run in parallel on separate pooled connections.
+
+        The merged frame will be pivoted later to one row per student.
+        """
+        # Student-level query: fixed columns, one row per student
+        students_query = """
+        SELECT
+            -- Test Date
+            COALESCE(ts.TestStartDateTime, cc.ExamStartDateTime) AS TestDate,
+
+            -- School Info
+            s.Id AS SchoolId,
+            s.SchoolName,
+
+            -- Student Info
+            u.UserId AS UserID,
+            u.LoginId AS StudentId,
             u.FirstName,
-            tr.QuestionID
+            u.LastName,
+            u.Gender,
+            u.Grade,
+
+            -- Region (from School.RegionID -> Region table)
+            COALESCE(reg.RegionName, 'N/A') AS Region
+
+        FROM (
+            SELECT DISTINCT UserID, ContestCreationID
+            FROM CCTTestResults WITH (NOLOCK)
+            WHERE ContestCreationID = ?
+        ) tr
+
+        INNER JOIN Users u WITH (NOLOCK)
+            ON tr.UserID = u.UserId
+
+        INNER JOIN School s WITH (NOLOCK)
+            ON u.SchoolId = s.Id
+
+        INNER JOIN ContestCreation cc WITH (NOLOCK)
+            ON tr.ContestCreationID = cc.ContestCreationID
+
+        -- Left join to test attendance for actual test date
+        LEFT JOIN CCTTestStudents ts WITH (NOLOCK)
+            ON tr.UserID = ts.UserId
+            AND tr.ContestCreationID = ts.ContestCreationId
+
+        LEFT JOIN Region reg WITH (NOLOCK)
+            ON s.RegionID = reg.RegionID
+
+        WHERE CAST(COALESCE(ts.TestStartDateTime, cc.ExamStartDateTime) AS DATE) = ?
         """
-        
-        # Execute query and return DataFrame
+
+        students_params: List[Any] = [contest_id, test_date.isoformat()]
+
+        # Add optional filters
+        if grade is not None:
+            students_query += " AND u.Grade = ?"
+            students_params.append(grade)
+
+        if school_id is not None:
+            students_query += " AND s.Id = ?"
+            students_params.append(school_id)
+
+        students_query += """
+        ORDER BY
+            s.SchoolName,
+            u.LastName,
+            u.FirstName
+        """
+
+        # Question-level query: narrow per-question columns only.
+        # TOP clause is optional - 0 means no limit
+        top_clause = f"TOP {self.max_rows}" if self.max_rows > 0 else ""
+        questions_query = f"""
+        SELECT {top_clause}
+            tr.UserID,
+            tr.QuestionID,
+            COALESCE(qb.QuestionType, 'N/A') AS QuestionType,
+            COALESCE(subj.SubjectName, 'N/A') AS Subject,
+            COALESCE(lvl.LovName, 'N/A') AS Level,
+
+            -- Answers and Score (mark unanswered; HTML tags in the
+            -- correct answer are stripped client-side in one vectorized pass)
+            CASE
+                WHEN tr.UserAnswer IS NULL OR tr.UserAnswer = '' THEN 'Not Answered'
+                ELSE tr.UserAnswer
+            END AS StudentAnswer,
+            COALESCE(qb.Answer, 'N/A') AS CorrectAnswer,
+            COALESCE(tr.Credits, 0) AS Score
+
+        FROM CCTTestResults tr WITH (NOLOCK)
+
+        LEFT JOIN QBankMaster qb WITH (NOLOCK)
+            ON tr.QuestionID = qb.QuestionID
+
+        LEFT JOIN Subject subj WITH (NOLOCK)
+            ON qb.SubjectId = subj.SubjectId
+
+        LEFT JOIN Lov lvl WITH (NOLOCK)
+            ON qb.Level = lvl.LovId
+
+        WHERE tr.ContestCreationID = ?
+        ORDER BY tr.QuestionID
+        """
+
+        questions_params: List[Any] = [contest_id]
+
         try:
-            with db.get_connection() as conn:
-                df = pd.read_sql_query(query, conn, params=params)
-                return df
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                students_future = executor.submit(
+                    self._fetch_dataframe, students_query, students_params
+                )
+                questions_future = executor.submit(
+                    self._fetch_dataframe, questions_query, questions_params
+                )
+                students_df = students_future.result()
+                questions_df = questions_future.result()
         except Exception as e:
             raise DatabaseError(f"Error fetching student responses: {str(e)}")
+
+        # Re-attach question rows to their students; the inner join also
+        # drops responses from students excluded by the date/grade/school
+        # filters above. Left-frame order (school, name) is preserved.
+        merged = students_df.merge(questions_df, on='UserID', how='inner')
+        return self._coerce_report_dtypes(merged.drop(columns=['UserID']))
     
     def get_contest_info(self, contest_id: int) -> Dict[str, Any]:
         """
         Get basic information about a contest.
         Useful for report headers and validation.
+        Results are cached in-process since contest metadata rarely changes.
         """
+        cached = _metadata_cache.get(('contest_info', contest_id))
+        if cached is not _MISSING:
+            return cached
+
         # Using only columns that are likely to exist
         query = """
         SELECT TOP 1
@@ -154,21 +388,42 @@ class QueryService:
         """
         
         try:
-            with db.get_cursor() as cursor:
+            with db.get_statement(query) as cursor:
                 cursor.execute(query, [contest_id])
                 row = cursor.fetchone()
                 if row:
                     columns = [column[0] for column in cursor.description]
-                    return dict(zip(columns, row))
-                return {}
+                    info = dict(zip(columns, row))
+                else:
+                    info = {}
+                _metadata_cache.set(('contest_info', contest_id), info, METADATA_CACHE_TTL)
+                return info
         except Exception as e:
             raise DatabaseError(f"Error fetching contest info: {str(e)}")
     
+    def get_report_prelude(self, contest_id: int) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Existence check and contest info from a single query.
+        Replaces the validate_contest_exists + get_contest_info pair the
+        route handlers used to call back-to-back (two round-trips for
+        what one TOP 1 SELECT answers).
+        """
+        info = self.get_contest_info(contest_id)
+        exists = bool(info)
+        # The existence answer came for free - seed the validation cache
+        _metadata_cache.set(('contest_exists', contest_id), exists, VALIDATION_CACHE_TTL)
+        return exists, info
+
     def get_question_count(self, contest_id: int) -> int:
         """
         Get the number of unique questions in a contest.
         Used for determining Excel column structure.
+        Results are cached in-process since contest metadata rarely changes.
         """
+        cached = _metadata_cache.get(('question_count', contest_id))
+        if cached is not _MISSING:
+            return cached
+
         query = """
         SELECT COUNT(DISTINCT tr.QuestionID) AS QuestionCount
         FROM CCTTestResults tr WITH (NOLOCK)
@@ -176,17 +431,50 @@ class QueryService:
         """
         
         try:
-            with db.get_cursor() as cursor:
+            with db.get_statement(query) as cursor:
                 cursor.execute(query, [contest_id])
                 row = cursor.fetchone()
-                return row[0] if row else 0
+                count = row[0] if row else 0
+                _metadata_cache.set(('question_count', contest_id), count, METADATA_CACHE_TTL)
+                return count
         except Exception as e:
             raise DatabaseError(f"Error fetching question count: {str(e)}")
     
+    def get_question_ids(self, contest_id: int) -> List[int]:
+        """
+        Get the ordered list of unique question IDs in a contest.
+        Drives the column layout of the server-side pivot.
+        Results are cached in-process since contest metadata rarely changes.
+        """
+        cached = _metadata_cache.get(('question_ids', contest_id))
+        if cached is not _MISSING:
+            return cached
+
+        query = """
+        SELECT DISTINCT tr.QuestionID
+        FROM CCTTestResults tr WITH (NOLOCK)
+        WHERE tr.ContestCreationID = ?
+        ORDER BY tr.QuestionID
+        """
+
+        try:
+            with db.get_statement(query) as cursor:
+                cursor.execute(query, [contest_id])
+                question_ids = [row[0] for row in cursor.fetchall()]
+                _metadata_cache.set(('question_ids', contest_id), question_ids, METADATA_CACHE_TTL)
+                return question_ids
+        except Exception as e:
+            raise DatabaseError(f"Error fetching question IDs: {str(e)}")
+
     def validate_contest_exists(self, contest_id: int) -> bool:
         """
         Check if a contest exists in the database.
+        Cached with a long TTL - contests are created, not destroyed.
         """
+        cached = _metadata_cache.get(('contest_exists', contest_id))
+        if cached is not _MISSING:
+            return cached
+
         query = """
         SELECT TOP 1 1
         FROM ContestCreation WITH (NOLOCK)
@@ -194,9 +482,11 @@ class QueryService:
         """
         
         try:
-            with db.get_cursor() as cursor:
+            with db.get_statement(query) as cursor:
                 cursor.execute(query, [contest_id])
-                return cursor.fetchone() is not None
+                exists = cursor.fetchone() is not None
+                _metadata_cache.set(('contest_exists', contest_id), exists, VALIDATION_CACHE_TTL)
+                return exists
         except Exception as e:
             raise DatabaseError(f"Error validating contest: {str(e)}")
     
@@ -204,7 +494,12 @@ class QueryService:
         """
         Get all unique test dates for a contest.
         Returns a list of dates in YYYY-MM-DD format, sorted descending.
+        Results are cached in-process since contest metadata rarely changes.
         """
+        cached = _metadata_cache.get(('test_dates', contest_id))
+        if cached is not _MISSING:
+            return cached
+
         query = """
         SELECT DISTINCT 
             CAST(COALESCE(ts.TestStartDateTime, cc.ExamStartDateTime) AS DATE) AS TestDate
@@ -219,13 +514,19 @@ class QueryService:
         """
         
         try:
-            with db.get_cursor() as cursor:
+            with db.get_statement(query) as cursor:
                 cursor.execute(query, [contest_id])
                 rows = cursor.fetchall()
-                return [row[0].strftime('%Y-%m-%d') if row[0] else None for row in rows if row[0]]
+                dates = [row[0].strftime('%Y-%m-%d') if row[0] else None for row in rows if row[0]]
+                _metadata_cache.set(('test_dates', contest_id), dates, METADATA_CACHE_TTL)
+                return dates
         except Exception as e:
             raise DatabaseError(f"Error fetching test dates: {str(e)}")
 
+    def clear_metadata_cache(self):
+        """Drop all cached metadata (manual invalidation hook)"""
+        _metadata_cache.clear()
+
 
 # Global service instance
 query_service = QueryService()
@@ -1,95 +1,165 @@
 """Verify database data matches Excel output"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from database import db
 
-with db.get_cursor() as cursor:
-    print('='*80)
-    print('VERIFICATION: Student 1310050561 (Hasini Durga Kammala)')
-    print('='*80)
-    
-    # 1. Users table
-    print()
-    print('>>> TABLE: Users')
-    cursor.execute('''
-        SELECT UserId, LoginId, FirstName, LastName, Gender, Grade, SchoolId
-        FROM Users WITH (NOLOCK) WHERE LoginId = '1310050561'
-    ''')
-    row = cursor.fetchone()
-    print(f'  UserId: {row[0]}')
-    print(f'  LoginId (StudentId): {row[1]}')
-    print(f'  FirstName: {row[2]}')
-    print(f'  LastName: {row[3]}')
-    print(f'  Gender: {row[4]}')
-    print(f'  Grade: {row[5]}')
-    print(f'  SchoolId: {row[6]}')
-    user_id = row[0]
-    
-    # 2. School table
-    print()
-    print('>>> TABLE: School')
-    cursor.execute('''
-        SELECT Id, SchoolName, RegionID FROM School WITH (NOLOCK) WHERE Id = 188254
-    ''')
-    row = cursor.fetchone()
-    print(f'  SchoolId: {row[0]}')
-    print(f'  SchoolName: {row[1]}')
-    print(f'  RegionID: {row[2]}')
-    
-    # 3. Region table
-    print()
-    print('>>> TABLE: Region')
-    cursor.execute('SELECT RegionID, RegionName FROM Region WITH (NOLOCK) WHERE RegionID = 3')
-    row = cursor.fetchone()
-    print(f'  RegionID: {row[0]}')
-    print(f'  RegionName: {row[1]}')
-    
-    # 4. CCTTestResults
-    print()
-    print('>>> TABLE: CCTTestResults (First 6 questions for this student)')
-    cursor.execute('''
-        SELECT 
-            ROW_NUMBER() OVER (ORDER BY QuestionID) as QNum,
-            QuestionID, 
-            UserAnswer, 
-            Credits
-        FROM CCTTestResults WITH (NOLOCK) 
-        WHERE ContestCreationID = 178 AND UserID = 307565
-        ORDER BY QuestionID
-    ''')
-    rows = cursor.fetchall()
-    for row in rows[:6]:
-        print(f'    Q{row[0]}: QuestionID={row[1]}, UserAnswer="{row[2]}", Credits={row[3]}')
-    print(f'    ... ({len(rows)} total questions)')
-    
-    # 5. QBankMaster for specific questions
-    print()
-    print('>>> TABLE: QBankMaster (Question details)')
-    cursor.execute('''
-        SELECT QuestionID, SubjectId, Answer, QuestionType, Level
-        FROM QBankMaster WITH (NOLOCK)
-        WHERE QuestionID IN (81719, 82350, 81689)
-    ''')
-    for row in cursor.fetchall():
-        ans = row[2][:30] if row[2] else 'NULL'
-        print(f'    QID={row[0]}: SubjectId={row[1]}, Answer="{ans}", Type={row[3]}, Level={row[4]}')
-    
-    # 6. Subject table
-    print()
-    print('>>> TABLE: Subject')
-    cursor.execute('SELECT SubjectId, SubjectName FROM Subject WITH (NOLOCK)')
-    for row in cursor.fetchall():
-        print(f'    SubjectId={row[0]}: {row[1]}')
-    
-    # 7. Lov table for levels
-    print()
-    print('>>> TABLE: Lov (Level names)')
-    cursor.execute('''
-        SELECT LovId, LovName FROM Lov WITH (NOLOCK) 
-        WHERE LovId IN (3286, 3287, 3288)
-    ''')
-    for row in cursor.fetchall():
-        print(f'    LovId={row[0]}: {row[1]}')
-
-print()
-print('='*80)
-print('COMPARE WITH EXCEL ROW 649 (Student 1310050561)')
-print('='*80)
+# The default student/contest verified when run without arguments
+STUDENT_LOGIN_ID = '1310050561'
+CONTEST_ID = 178
+QUESTION_IDS = (81719, 82350, 81689)
+
+# SQL Server caps a statement at ~2100 bound parameters, so UserID IN
+# lists are chunked to stay safely under it
+RESULTS_CHUNK_SIZE = 2000
+
+# Verification is set-oriented: one range query over Users covers every
+# student being checked (client-side filtered back to the exact set),
+# and one IN-list query per 2000 students covers their result previews.
+# Checking N students costs a handful of round-trips instead of N
+# batches. Reference lookups (School, Region, Subject, Lov) are JOINed
+# into the queries that hold their foreign keys, and values are bound as
+# ? parameters so SQL Server can reuse the cached plan across runs.
+STUDENTS_RANGE_SQL = '''
+    SELECT u.UserId, u.LoginId, u.FirstName, u.LastName, u.Gender, u.Grade,
+           u.SchoolId, s.SchoolName, s.RegionID, r.RegionName
+    FROM Users u
+    JOIN School s ON s.Id = u.SchoolId
+    JOIN Region r ON r.RegionID = s.RegionID
+    WHERE u.LoginId BETWEEN ? AND ?;
+'''
+
+RESULTS_PREVIEW_SQL = '''
+    SELECT UserID, QNum, QuestionID, UserAnswer, Credits, Total
+    FROM (
+        SELECT UserID,
+               ROW_NUMBER() OVER (PARTITION BY UserID ORDER BY QuestionID) AS QNum,
+               QuestionID,
+               UserAnswer,
+               Credits,
+               COUNT(*) OVER (PARTITION BY UserID) AS Total
+        FROM CCTTestResults
+        WHERE ContestCreationID = ? AND UserID IN ({placeholders})
+    ) preview
+    WHERE QNum <= 6
+    ORDER BY UserID, QNum;
+'''
+
+QUESTION_DETAILS_SQL = '''
+    SELECT qb.QuestionID, qb.SubjectId, subj.SubjectName,
+           LEFT(ISNULL(qb.Answer, 'NULL'), 30) AS Answer,
+           qb.QuestionType, qb.Level, lvl.LovName
+    FROM QBankMaster qb
+    LEFT JOIN Subject subj ON subj.SubjectId = qb.SubjectId
+    LEFT JOIN Lov lvl ON lvl.LovId = qb.Level
+    WHERE qb.QuestionID IN (?, ?, ?);
+'''
+
+
+@lru_cache(maxsize=None)
+def get_question_details(question_ids):
+    """
+    Question bank rows with Subject/Level names. Questions are reference
+    data shared by every student in a contest, so the result is memoized -
+    verifying a loop of students hits the DB once instead of per student.
+    """
+    with db.get_cursor() as cursor:
+        cursor.execute(QUESTION_DETAILS_SQL, question_ids)
+        return cursor.fetchall()
+
+
+def fetch_students(cursor, login_ids):
+    """
+    One range scan over Users covering every requested LoginId. The
+    BETWEEN min/max predicate keeps the query at two parameters no
+    matter how many students are checked; rows inside the range that
+    were not asked for are filtered out client-side.
+    """
+    cursor.execute(STUDENTS_RANGE_SQL, (min(login_ids), max(login_ids)))
+    wanted = set(login_ids)
+    return [row for row in cursor.fetchall() if row.LoginId in wanted]
+
+
+def fetch_result_previews(cursor, user_ids):
+    """
+    First-6-questions preview (with the per-student total riding along
+    via COUNT(*) OVER) for every student at once, keyed by UserID.
+    IN-lists are chunked to respect the parameter cap.
+    """
+    previews = {}
+    for start in range(0, len(user_ids), RESULTS_CHUNK_SIZE):
+        chunk = user_ids[start:start + RESULTS_CHUNK_SIZE]
+        sql = RESULTS_PREVIEW_SQL.format(placeholders=', '.join('?' * len(chunk)))
+        cursor.execute(sql, (CONTEST_ID, *chunk))
+        for row in cursor.fetchall():
+            previews.setdefault(row.UserID, []).append(row)
+    return previews
+
+
+def _fetch_student_data(login_ids):
+    """Students plus their result previews on one pooled connection."""
+    with db.get_cursor() as cursor:
+        cursor.arraysize = 500
+        students = fetch_students(cursor, login_ids)
+        previews = fetch_result_previews(cursor, [row.UserId for row in students])
+    return students, previews
+
+
+def verify_students(login_ids):
+    """Print the verification report for a batch of students."""
+    # The student pipeline and the question-details lookup are
+    # independent of each other, so they run on separate pooled
+    # connections and overlap their network waits - wall time is the
+    # slower of the two instead of their sum
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        student_future = pool.submit(_fetch_student_data, login_ids)
+        details_future = pool.submit(get_question_details, QUESTION_IDS)
+        students, previews = student_future.result()
+        question_rows = details_future.result()
+
+    # Output is collected into per-section line lists and flushed with a
+    # single sys.stdout.write per section - one write syscall per block
+    # instead of one per print() call
+    for student in students:
+        sys.stdout.write('\n'.join([
+            '='*80,
+            f'VERIFICATION: Student {student.LoginId} ({student.FirstName} {student.LastName})',
+            '='*80,
+            '',
+            '>>> TABLE: Users (+ School, Region)',
+            f'  UserId: {student.UserId}',
+            f'  LoginId (StudentId): {student.LoginId}',
+            f'  FirstName: {student.FirstName}',
+            f'  LastName: {student.LastName}',
+            f'  Gender: {student.Gender}',
+            f'  Grade: {student.Grade}',
+            f'  SchoolId: {student.SchoolId}',
+            f'  SchoolName: {student.SchoolName}',
+            f'  RegionID: {student.RegionID}',
+            f'  RegionName: {student.RegionName}',
+        ]) + '\n')
+
+        lines = ['', '>>> TABLE: CCTTestResults (First 6 questions for this student)']
+        total_questions = 0
+        for result in previews.get(student.UserId, ()):
+            lines.append(f'    Q{result.QNum}: QuestionID={result.QuestionID}, UserAnswer="{result.UserAnswer}", Credits={result.Credits}')
+            total_questions = result.Total
+        lines.append(f'    ... ({total_questions} total questions)')
+        sys.stdout.write('\n'.join(lines) + '\n')
+
+    lines = ['', '>>> TABLE: QBankMaster (Question details + Subject, Level names)']
+    for question in question_rows:
+        lines.append(f'    QID={question.QuestionID}: Subject={question.SubjectName} ({question.SubjectId}), Answer="{question.Answer}", Type={question.QuestionType}, Level={question.LovName} ({question.Level})')
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+
+if __name__ == '__main__':
+    verify_students([STUDENT_LOGIN_ID])
+
+    sys.stdout.write('\n'.join([
+        '',
+        '='*80,
+        f'COMPARE WITH EXCEL ROW 649 (Student {STUDENT_LOGIN_ID})',
+        '='*80,
+    ]) + '\n')